@@ -21,7 +21,10 @@ Output (default):
 import argparse
 import re
 import sys
-from typing import Iterator, Tuple, Optional
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from typing import Iterable, Iterator, List, Tuple, Optional
 
 try:
     import mappy as mp
@@ -29,24 +32,53 @@ except ImportError:
     sys.stderr.write("[ERROR] mappy not found. Install with: pip install mappy\n")
     sys.exit(1)
 
-def parse_fastq(path: str) -> Iterator[Tuple[str, str]]:
-    with open(path, "r", newline="") as fh:
+# number of reads handed to a worker process at a time
+BATCH_SIZE = 1024
+# size of each binary read from the FASTQ file (4 MiB)
+READ_CHUNK = 1 << 22
+
+# per-process aligner state, set up once by init_worker()
+_aligner = None
+_min_mapq = 0
+_min_span = 0
+# error raised while building the worker's aligner; re-raised by find_hits()
+# so that a failing initializer does not leave the pool respawning workers
+_init_error = None
+
+def iter_lines(path: str) -> Iterator[bytes]:
+    """Yield lines as bytes (no trailing newline), reading in large binary chunks."""
+    with open(path, "rb") as fh:
+        rest = b""
         while True:
-            id_line = fh.readline()
-            if not id_line:
-                break
-            seq_line = fh.readline()
-            plus_line = fh.readline()
-            qual_line = fh.readline()
-            if not (seq_line and plus_line and qual_line):
+            data = fh.read(READ_CHUNK)
+            if not data:
                 break
-            if not id_line.startswith("@"):
-                continue
-            rid = id_line.strip().split()[0]
-            seq = seq_line.strip()
-            yield rid, seq
+            lines = (rest + data).split(b"\n")
+            rest = lines.pop()
+            yield from lines
+        if rest:
+            yield rest
+
+def parse_fastq(path: str) -> Iterator[Tuple[bytes, bytes]]:
+    lines = iter_lines(path)
+    for id_line, seq_line, plus_line, qual_line in zip(lines, lines, lines, lines):
+        if not id_line.startswith(b"@"):
+            continue
+        rid = id_line.split(None, 1)[0]
+        # lines come without "\n"; only a CRLF "\r" has to be sliced off
+        seq = seq_line[:-1] if seq_line.endswith(b"\r") else seq_line
+        yield rid, seq
+
+def batched(items: Iterable[Tuple[bytes, bytes]], size: int) -> Iterator[List[Tuple[bytes, bytes]]]:
+    """Group (read_id, sequence) records into lists of at most `size` items."""
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
 
-def best_hit_q_coords(aligner: mp.Aligner, seq: str, min_mapq: int, min_span: int) -> Optional[Tuple[int, int]]:
+def best_hit_q_coords(aligner: mp.Aligner, seq: bytes, min_mapq: int, min_span: int) -> Optional[Tuple[int, int]]:
     best = None
     best_score = (-1, -1)  # (mapq, span)
     for a in aligner.map(seq):
@@ -58,6 +90,30 @@ def best_hit_q_coords(aligner: mp.Aligner, seq: str, min_mapq: int, min_span: in
                 best = (a.q_st, a.q_en)
     return best
 
+def init_worker(tgt_path: str, preset: str, min_mapq: int, min_span: int) -> None:
+    global _aligner, _min_mapq, _min_span, _init_error
+    _min_mapq = min_mapq
+    _min_span = min_span
+    try:
+        _aligner = mp.Aligner(tgt_path, preset=preset, best_n=5)
+    except Exception as e:
+        _init_error = RuntimeError(f"failed to init aligner: {tgt_path} ({e!r})")
+        return
+    if not _aligner:
+        _init_error = RuntimeError(f"failed to init aligner: {tgt_path}")
+
+def find_hits(batch: List[Tuple[bytes, bytes]]) -> List[Tuple[int, int, int]]:
+    """Return (index in batch, q_st, q_en) of the best target hit for each read that has one.
+    Only coordinates go back to the parent, which still holds the batch."""
+    if _init_error is not None:
+        raise _init_error
+    hits = []
+    for i, (_, seq) in enumerate(batch):
+        hit = best_hit_q_coords(_aligner, seq, _min_mapq, _min_span)
+        if hit:
+            hits.append((i, hit[0], hit[1]))
+    return hits
+
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("tseqname", help="target fasta (tseqname)")
@@ -74,28 +130,67 @@ def main():
     if out == args.fastqname:
         out = args.fastqname + ".tgt_flanks.fa"
 
-    aln = mp.Aligner(args.tseqname, preset=args.preset, n_threads=args.threads, best_n=5)
-    if not aln:
+    # build one index up front so that a bad target/preset fails before the
+    # pool starts
+    tgt_aln = mp.Aligner(args.tseqname, preset=args.preset, best_n=5)
+    if not tgt_aln:
         sys.stderr.write(f"[ERROR] failed to init aligner: {args.tseqname}\n")
         sys.exit(2)
+    del tgt_aln
 
+    # each worker process builds its own (small) target index once and maps
+    # whole batches. At most `threads * 2` batches are in flight: the oldest
+    # result is written before the next batch is submitted, so memory stays
+    # bounded, the pool stays busy while the parent parses, and output keeps
+    # input order.
     n_in = n_hit = n_out = 0
-    with open(out, "w") as fo:
-        for rid, seq in parse_fastq(args.fastqname):
-            n_in += 1
-            hit = best_hit_q_coords(aln, seq, args.min_mapq, args.min_span)
-            if not hit:
-                continue
-            n_hit += 1
-            q_st, q_en = hit
-            up = seq[:q_st]
-            dn = seq[q_en:]
-            if len(up) >= args.min_flank_len:
-                fo.write(f">{rid}_up\n{up}\n")
-                n_out += 1
-            if len(dn) >= args.min_flank_len:
-                fo.write(f">{rid}_down\n{dn}\n")
-                n_out += 1
+    max_pending = args.threads * 2
+    pending = deque()
+    try:
+        with open(out, "wb", buffering=1 << 20) as fo, Pool(
+            args.threads,
+            initializer=init_worker,
+            initargs=(args.tseqname, args.preset, args.min_mapq, args.min_span),
+        ) as pool:
+
+            def write_oldest() -> Tuple[int, int]:
+                batch, result = pending.popleft()
+                try:
+                    hits = result.get()
+                except RuntimeError:
+                    # let the batches already queued fail as well, so that
+                    # terminating the pool does not block on a full task queue
+                    for _, queued in pending:
+                        queued.wait()
+                    raise
+                records = []
+                for i, q_st, q_en in hits:
+                    rid, seq = batch[i]
+                    up = seq[:q_st]
+                    dn = seq[q_en:]
+                    if len(up) >= args.min_flank_len:
+                        records.append(b">%s_up\n%s\n" % (rid, up))
+                    if len(dn) >= args.min_flank_len:
+                        records.append(b">%s_down\n%s\n" % (rid, dn))
+                # one write per batch
+                fo.write(b"".join(records))
+                return len(hits), len(records)
+
+            for batch in batched(parse_fastq(args.fastqname), BATCH_SIZE):
+                if len(pending) >= max_pending:
+                    batch_hit, batch_out = write_oldest()
+                    n_hit += batch_hit
+                    n_out += batch_out
+                pending.append((batch, pool.apply_async(find_hits, (batch,))))
+                n_in += len(batch)
+            while pending:
+                batch_hit, batch_out = write_oldest()
+                n_hit += batch_hit
+                n_out += batch_out
+    except RuntimeError as e:
+        # raised by a worker whose aligner could not be built
+        sys.stderr.write(f"[ERROR] {e}\n")
+        sys.exit(2)
 
     sys.stderr.write(f"[INFO] processed={n_in}, tgt_hit={n_hit}, written={n_out}, output={out}\n")
 
@@ -8,7 +8,10 @@ ID: keep full ID from '@' to before first TAB (if present).
 
 import argparse
 import sys
-from typing import Iterator, Tuple, Optional
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from typing import Iterable, Iterator, List, Tuple, Optional
 
 try:
     import mappy as mp
@@ -16,33 +19,82 @@ except ImportError:
     sys.stderr.write("[ERROR] mappy not found. Please `pip install mappy`.\n")
     sys.exit(1)
 
+# number of reads handed to a worker process at a time
+BATCH_SIZE = 1024
+# size of each binary read from the FASTQ file (4 MiB)
+READ_CHUNK = 1 << 22
 
-def parse_fastq(path: str) -> Iterator[Tuple[str, str]]:
-    with open(path, "r", newline="") as fh:
+# per-process aligner state, set up once by init_worker()
+_aligner = None
+_min_mapq = 0
+# error raised while building the worker's aligner; re-raised by filter_hits()
+# so that a failing initializer does not leave the pool respawning workers
+_init_error = None
+
+
+def iter_lines(path: str) -> Iterator[bytes]:
+    """Yield lines as bytes (no trailing newline), reading in large binary chunks."""
+    with open(path, "rb") as fh:
+        rest = b""
         while True:
-            id_line = fh.readline()
-            if not id_line:
+            data = fh.read(READ_CHUNK)
+            if not data:
                 break
-            seq_line = fh.readline()
-            plus_line = fh.readline()
-            qual_line = fh.readline()
-            if not (seq_line and plus_line and qual_line):
-                break
-            if not id_line.startswith("@"):
-                continue
+            lines = (rest + data).split(b"\n")
+            rest = lines.pop()
+            yield from lines
+        if rest:
+            yield rest
+
+
+def parse_fastq(path: str) -> Iterator[Tuple[bytes, bytes]]:
+    lines = iter_lines(path)
+    for id_line, seq_line, plus_line, qual_line in zip(lines, lines, lines, lines):
+        if not id_line.startswith(b"@"):
+            continue
+
+        # keep full ID from '@' to before first TAB
+        rid = id_line.split(b"\t", 1)[0]
+        # lines come without "\n"; only a CRLF "\r" has to be sliced off
+        seq = seq_line[:-1] if seq_line.endswith(b"\r") else seq_line
+        yield rid, seq
+
 
-            # keep full ID from '@' to before first TAB
-            rid = id_line.rstrip("\n").split("\t", 1)[0]
-            seq = seq_line.strip()
-            yield rid, seq
+def batched(items: Iterable[Tuple[bytes, bytes]], size: int) -> Iterator[List[Tuple[bytes, bytes]]]:
+    """Group (read_id, sequence) records into lists of at most `size` items."""
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
 
 
-def has_hit(aligner: mp.Aligner, seq: str, min_mapq: int) -> bool:
-    best_mapq = -1
+def has_hit(aligner: mp.Aligner, seq: bytes, min_mapq: int) -> bool:
+    # any qualifying alignment is enough; stop at the first one
     for a in aligner.map(seq):
-        if a.q_en > a.q_st and a.mapq > best_mapq:
-            best_mapq = a.mapq
-    return best_mapq >= min_mapq
+        if a.q_en > a.q_st and a.mapq >= min_mapq:
+            return True
+    return False
+
+
+def init_worker(tgt_path: str, preset: str, min_mapq: int) -> None:
+    global _aligner, _min_mapq, _init_error
+    _min_mapq = min_mapq
+    try:
+        _aligner = mp.Aligner(tgt_path, preset=preset)
+    except Exception as e:
+        _init_error = RuntimeError(f"failed to init aligner: {tgt_path} ({e!r})")
+        return
+    if not _aligner:
+        _init_error = RuntimeError(f"failed to init aligner: {tgt_path}")
+
+
+def filter_hits(batch: List[Tuple[bytes, bytes]]) -> List[int]:
+    if _init_error is not None:
+        raise _init_error
+    # return only the indices of kept reads; the parent still holds the batch
+    return [i for i, (_, seq) in enumerate(batch) if has_hit(_aligner, seq, _min_mapq)]
 
 
 def main():
@@ -57,19 +109,52 @@ def main():
 
     out_fa = args.out or (args.fastqname.rsplit(".fastq", 1)[0] + ".tgt.fasta")
 
-    tgt_aln = mp.Aligner(args.tseqname, preset=args.preset, n_threads=args.threads)
+    # build one index up front so that a bad target/preset fails before the
+    # pool starts; the index is small, and each worker builds its own copy
+    tgt_aln = mp.Aligner(args.tseqname, preset=args.preset)
     if not tgt_aln:
         sys.stderr.write(f"[ERROR] failed to init aligner: {args.tseqname}\n")
         sys.exit(1)
+    del tgt_aln
 
+    # each worker process builds its own (small) target index once and
+    # filters whole batches. At most `threads * 2` batches are in flight:
+    # the oldest result is written before the next batch is submitted, so
+    # memory stays bounded, the pool stays busy while the parent parses,
+    # and output keeps input order.
     n_in = 0
     n_out = 0
-    with open(out_fa, "w") as out:
-        for rid, seq in parse_fastq(args.fastqname):
-            n_in += 1
-            if has_hit(tgt_aln, seq, args.min_mapq):
-                out.write(f">{rid}\n{seq}\n")
-                n_out += 1
+    max_pending = args.threads * 2
+    pending = deque()
+    try:
+        with open(out_fa, "wb", buffering=1 << 20) as out, Pool(
+            args.threads, initializer=init_worker, initargs=(args.tseqname, args.preset, args.min_mapq)
+        ) as pool:
+
+            def write_oldest() -> int:
+                batch, result = pending.popleft()
+                try:
+                    kept = result.get()
+                except RuntimeError:
+                    # let the batches already queued fail as well, so that
+                    # terminating the pool does not block on a full task queue
+                    for _, queued in pending:
+                        queued.wait()
+                    raise
+                out.write(b"".join([b">%s\n%s\n" % batch[i] for i in kept]))
+                return len(kept)
+
+            for batch in batched(parse_fastq(args.fastqname), BATCH_SIZE):
+                if len(pending) >= max_pending:
+                    n_out += write_oldest()
+                pending.append((batch, pool.apply_async(filter_hits, (batch,))))
+                n_in += len(batch)
+            while pending:
+                n_out += write_oldest()
+    except RuntimeError as e:
+        # raised by a worker whose aligner could not be built
+        sys.stderr.write(f"[ERROR] {e}\n")
+        sys.exit(1)
 
     sys.stderr.write(f"[INFO] processed={n_in}, passed(target)={n_out}, output={out_fa}\n")
 
@@ -4,12 +4,18 @@
 # Usage:
 #   python3 Target_seq_extraction.py flanking_up.fa flanking_down.fa target.fa input.fastq
 # Options:
-#   --threads 14 --min-mapq 20 --preset map-ont
+#   --threads 14 --min-mapq 20 --preset map-ont [--combined-index] [--cache-size N]
 
+import os
 import sys
 import re
 import argparse
-from typing import Iterator, Tuple, Optional
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional
 
 try:
     import mappy as mp
@@ -19,32 +25,62 @@ except ImportError:
     )
     sys.exit(1)
 
+# Number of reads handed to the thread pool at a time
+BATCH_SIZE = 1024
+# Size of each binary read from the FASTQ file (4 MiB)
+READ_CHUNK = 1 << 22
+# minimap2 caps MAPQ at 60, so a hit with this MAPQ cannot be beaten
+MAX_MAPQ = 60
 
-def parse_fastq(path: str) -> Iterator[Tuple[str, str]]:
+
+def iter_lines(path: str) -> Iterator[bytes]:
     """
-    Simple FASTQ parser that reads records in 4-line blocks and returns
-    (read_id, sequence).
+    Yield the lines of a file as bytes (without the trailing newline),
+    reading it in large binary chunks instead of one readline() per line.
     """
-    with open(path, "r", newline="") as fh:
+    with open(path, "rb") as fh:
+        rest = b""
         while True:
-            id_line = fh.readline()
-            if not id_line:
-                break
-            seq_line = fh.readline()
-            plus_line = fh.readline()
-            qual_line = fh.readline()
-            if not (seq_line and plus_line and qual_line):
+            data = fh.read(READ_CHUNK)
+            if not data:
                 break
-            if not id_line.startswith("@"):
-                # Skip unexpected formats
-                continue
-            rid = id_line.strip().split()[0]  # use only the first field
-            seq = seq_line.strip()
-            yield (rid, seq)
+            lines = (rest + data).split(b"\n")
+            rest = lines.pop()
+            yield from lines
+        if rest:
+            yield rest
+
+
+def parse_fastq(path: str) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Simple FASTQ parser that reads records in 4-line blocks and returns
+    (read_id, sequence) as bytes; mappy accepts bytes sequences directly.
+    """
+    lines = iter_lines(path)
+    for id_line, seq_line, plus_line, qual_line in zip(lines, lines, lines, lines):
+        if not id_line.startswith(b"@"):
+            # Skip unexpected formats
+            continue
+        rid = id_line.split(None, 1)[0]  # use only the first field
+        # lines come without "\n"; only a CRLF "\r" has to be sliced off
+        seq = seq_line[:-1] if seq_line.endswith(b"\r") else seq_line
+        yield (rid, seq)
+
+
+def batched(items: Iterable[Tuple[bytes, bytes]], size: int) -> Iterator[List[Tuple[bytes, bytes]]]:
+    """
+    Group (read_id, sequence) records into lists of at most `size` items.
+    """
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
 
 
 def best_hit_q_coords(
-    aligner: mp.Aligner, seq: str, min_mapq: int
+    aligner: mp.Aligner, seq: bytes, min_mapq: int
 ) -> Optional[Tuple[int, int]]:
     """
     Align the given read sequence to the provided aligner and return
@@ -60,6 +96,70 @@ def best_hit_q_coords(
             if a.mapq > best_mapq:
                 best_mapq = a.mapq
                 best = (a.q_st, a.q_en)
+                if best_mapq >= MAX_MAPQ:
+                    break
+    return best
+
+
+def cached_best_hit(
+    aligner: mp.Aligner, min_mapq: int, maxsize: int
+) -> Callable[[bytes], Optional[Tuple[int, int]]]:
+    """
+    Return best_hit_q_coords bound to the given aligner and threshold.
+    If maxsize > 0 it is memoized on the read sequence so that exact
+    duplicate reads are aligned only once; maxsize <= 0 disables caching.
+    """
+    def _hit(seq: bytes) -> Optional[Tuple[int, int]]:
+        return best_hit_q_coords(aligner, seq, min_mapq)
+
+    return lru_cache(maxsize=maxsize)(_hit) if maxsize > 0 else _hit
+
+
+def build_combined_aligner(
+    refs: List[Tuple[str, str]], preset: str, n_threads: int
+) -> Tuple[mp.Aligner, Dict[str, str]]:
+    """
+    Write the (label, FASTA path) references into one temporary FASTA,
+    renaming contigs to <label>_<n>, and build a single index over it.
+    Returns the aligner and a mapping from contig name to label.
+    Exits like the per-reference path if a reference yields no sequence.
+    """
+    labels = {}
+    tmp = tempfile.NamedTemporaryFile("w", suffix=".fa", delete=False)
+    try:
+        with tmp:
+            for label, path in refs:
+                n = 0
+                for n, (_, ref_seq, _) in enumerate(mp.fastx_read(path), 1):
+                    ctg = f"{label}_{n}"
+                    labels[ctg] = label
+                    tmp.write(f">{ctg}\n{ref_seq}\n")
+                # mappy yields nothing for a missing or unreadable FASTA
+                if n == 0:
+                    sys.stderr.write(f"[ERROR] Failed to initialize aligner: {path}\n")
+                    sys.exit(1)
+        aligner = mp.Aligner(tmp.name, preset=preset, n_threads=n_threads)
+    finally:
+        os.unlink(tmp.name)
+    return aligner, labels
+
+
+def best_hits_by_label(
+    aligner: mp.Aligner, labels: Dict[str, str], seq: bytes, min_mapq: int
+) -> Dict[str, Tuple[int, int]]:
+    """
+    Align the read once against a combined index and return, for each
+    reference label, the query interval [q_st, q_en) of the hit with the
+    highest MAPQ passing the given threshold.
+    """
+    best = {}
+    best_mapq = {}
+    for a in aligner.map(seq):
+        if a.mapq >= min_mapq and a.q_en > a.q_st:
+            label = labels[a.ctg]
+            if a.mapq > best_mapq.get(label, -1):
+                best_mapq[label] = a.mapq
+                best[label] = (a.q_st, a.q_en)
     return best
 
 
@@ -71,9 +171,20 @@ def main():
     p.add_argument("fastqname")   # input FASTQ
     p.add_argument("--threads", type=int, default=14)
     p.add_argument("--min-mapq", type=int, default=10)
+    p.add_argument(
+        "--cache-size", type=int, default=0,
+        help="cache hits for up to N distinct read sequences per reference (default: 0, off). "
+             "Only worth enabling when exact duplicate reads are common (e.g. amplicon data); "
+             "they are rare in ONT runs, and every cached read is kept in memory",
+    )
     p.add_argument(
         "--preset", default="map-ont"
     )  # ONT preset (modify if needed)
+    p.add_argument(
+        "--combined-index", action="store_true",
+        help="map each read once against a single index of up/down/target "
+             "(faster; only use when the three references do not share sequence)",
+    )
     args = p.parse_args()
 
     # Output file name (same convention as the original script)
@@ -81,55 +192,108 @@ def main():
 
     # Initialize aligners (mappy builds indices from reference FASTA files)
     # References are small, so loading overhead is minimal
-    up_aln = mp.Aligner(args.fseq1name, preset=args.preset, n_threads=args.threads)
-    if not up_aln:
-        sys.stderr.write(f"[ERROR] Failed to initialize aligner: {args.fseq1name}\n")
-        sys.exit(1)
+    if args.combined_index:
+        # One index over up/down/target: a single minimap2 pass per read,
+        # hits are classified by contig label
+        aln, labels = build_combined_aligner(
+            [("up", args.fseq1name), ("down", args.fseq2name), ("tgt", args.tseqname)],
+            args.preset, args.threads,
+        )
+        if not aln:
+            sys.stderr.write("[ERROR] Failed to initialize combined aligner\n")
+            sys.exit(1)
 
-    down_aln = mp.Aligner(args.fseq2name, preset=args.preset, n_threads=args.threads)
-    if not down_aln:
-        sys.stderr.write(f"[ERROR] Failed to initialize aligner: {args.fseq2name}\n")
-        sys.exit(1)
+        def combined_hits(seq: bytes) -> Dict[str, Tuple[int, int]]:
+            return best_hits_by_label(aln, labels, seq, args.min_mapq)
 
-    tgt_aln = mp.Aligner(args.tseqname, preset=args.preset, n_threads=args.threads)
-    if not tgt_aln:
-        sys.stderr.write(f"[ERROR] Failed to initialize aligner: {args.tseqname}\n")
-        sys.exit(1)
+        if args.cache_size > 0:
+            combined_hits = lru_cache(maxsize=args.cache_size)(combined_hits)
 
-    # Write header once
-    with open(outputname, "w") as out:
-        out.write("Repeatsize\tReadID\tSequence\n")
+        def flank_hits(record: Tuple[bytes, bytes]) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
+            # Return (up, down) query intervals if the read hits up, down and target
+            hits = combined_hits(record[1])
+            if "up" not in hits or "down" not in hits or "tgt" not in hits:
+                return None
+            return hits["up"], hits["down"]
+    else:
+        up_aln = mp.Aligner(args.fseq1name, preset=args.preset, n_threads=args.threads)
+        if not up_aln:
+            sys.stderr.write(f"[ERROR] Failed to initialize aligner: {args.fseq1name}\n")
+            sys.exit(1)
 
-    # Process each read
-    count_in = 0
-    count_pass = 0
-    with open(outputname, "a") as out:
-        for rid, seq in parse_fastq(args.fastqname):
-            count_in += 1
+        down_aln = mp.Aligner(args.fseq2name, preset=args.preset, n_threads=args.threads)
+        if not down_aln:
+            sys.stderr.write(f"[ERROR] Failed to initialize aligner: {args.fseq2name}\n")
+            sys.exit(1)
+
+        tgt_aln = mp.Aligner(args.tseqname, preset=args.preset, n_threads=args.threads)
+        if not tgt_aln:
+            sys.stderr.write(f"[ERROR] Failed to initialize aligner: {args.tseqname}\n")
+            sys.exit(1)
 
-            up = best_hit_q_coords(up_aln, seq, args.min_mapq)
+        # Optionally memoize hits per reference so that duplicate reads skip minimap2
+        up_hit = cached_best_hit(up_aln, args.min_mapq, args.cache_size)
+        down_hit = cached_best_hit(down_aln, args.min_mapq, args.cache_size)
+        tgt_hit = cached_best_hit(tgt_aln, args.min_mapq, args.cache_size)
+
+        def flank_hits(record: Tuple[bytes, bytes]) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
+            # Return (up, down) query intervals if the read hits up, down and target
+            seq = record[1]
+            up = up_hit(seq)
             if not up:
-                continue
-            down = best_hit_q_coords(down_aln, seq, args.min_mapq)
+                return None
+            down = down_hit(seq)
             if not down:
-                continue
-            tgt = best_hit_q_coords(tgt_aln, seq, args.min_mapq)
+                return None
+            tgt = tgt_hit(seq)
             if not tgt:
-                continue
-
-            # Estimate repeat size from read coordinates where up/down flanks align
-            u0, u1 = up
-            d0, d1 = down
-            candidates = (
-                abs(u0 - d0),
-                abs(u0 - d1),
-                abs(u1 - d0),
-                abs(u1 - d1),
-            )
-            repeatsize = min(candidates)
-
-            out.write(f"{repeatsize}\t{rid}\t{seq}\n")
-            count_pass += 1
+                return None
+            return up, down
+
+    # Write header once
+    with open(outputname, "wb") as out:
+        out.write(b"Repeatsize\tReadID\tSequence\n")
+
+    def batch_hits(batch: List[Tuple[bytes, bytes]]) -> List[Optional[Tuple[Tuple[int, int], Tuple[int, int]]]]:
+        return [flank_hits(record) for record in batch]
+
+    # Each thread maps a whole batch; mappy releases the GIL during map(), so
+    # batches align in parallel. At most `threads * 2` batches are in flight:
+    # the oldest result is written before the next batch is submitted, so
+    # memory stays bounded, the pool stays busy while the main thread parses,
+    # and output keeps input order.
+    count_in = 0
+    count_pass = 0
+    max_pending = args.threads * 2
+    pending = deque()
+    with open(outputname, "ab") as out, ThreadPoolExecutor(max_workers=args.threads) as pool:
+
+        def write_oldest() -> int:
+            batch, future = pending.popleft()
+            n_pass = 0
+            for (rid, seq), hits in zip(batch, future.result()):
+                if not hits:
+                    continue
+
+                # Estimate repeat size from read coordinates where up/down flanks align:
+                # the gap between the two hits (q_st < q_en for both). Only when the
+                # hits overlap, fall back to the closest pair of endpoints.
+                (u0, u1), (d0, d1) = hits
+                repeatsize = max(u0, d0) - min(u1, d1)
+                if repeatsize < 0:
+                    repeatsize = min(abs(u0 - d0), abs(u0 - d1), abs(u1 - d0), abs(u1 - d1))
+
+                out.write(b"%d\t%s\t%s\n" % (repeatsize, rid, seq))
+                n_pass += 1
+            return n_pass
+
+        for batch in batched(parse_fastq(args.fastqname), BATCH_SIZE):
+            if len(pending) >= max_pending:
+                count_pass += write_oldest()
+            pending.append((batch, pool.submit(batch_hits, batch)))
+            count_in += len(batch)
+        while pending:
+            count_pass += write_oldest()
 
     sys.stderr.write(
         f"[INFO] processed={count_in}, passed(up/down/target)={count_pass}, "
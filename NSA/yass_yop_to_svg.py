@@ -15,31 +15,34 @@ import io
 import os
 import re
 import sys
-from typing import Tuple
+from typing import List, Tuple
 
 # Alignment line example:
 # *(1083406-1083463)(1290780-1290837) Ev: 9.1282 s: 58/58 f
+# (bytes, multi-line: scanned with finditer over the whole file at once)
 RE_ALN = re.compile(
-    r"^\*\((\d+)-(\d+)\)\((\d+)-(\d+)\)\s+Ev:\s+[^s]*\s+s:\s+\d+/\d+\s+([fr])\s*$"
+    rb"^\*\((\d+)-(\d+)\)\((\d+)-(\d+)\)[ \t]+Ev:[ \t]+[^s\n]*[ \t]+s:[ \t]+\d+/\d+[ \t]+([fr])[ \t\r]*$",
+    re.M,
 )
 
-def read_bounds(path: str, max_al: int) -> Tuple[int, int, int]:
-    """Return (qmax, rmax, n_aln). q=1st coord block, r=2nd coord block."""
+def read_alignments(path: str) -> List[Tuple[int, int, int, int, bool]]:
+    """Return (q1, q2, r1, r2, is_forward) for every alignment line, reading the file once."""
+    with open(path, "rb") as fh:
+        data = fh.read()
+    return [
+        (int(q1), int(q2), int(r1), int(r2), fr == b"f")
+        for q1, q2, r1, r2, fr in (m.groups() for m in RE_ALN.finditer(data))
+    ]
+
+def read_bounds(alns: List[Tuple[int, int, int, int, bool]], max_al: int) -> Tuple[int, int, int]:
+    """Return (qmax, rmax, n_aln) over the first max_al alignments. q=1st coord block, r=2nd coord block."""
     qmax = 0
     rmax = 0
     n = 0
-    with open(path, "r", encoding="utf-8", errors="ignore") as fh:
-        for line in fh:
-            m = RE_ALN.match(line)
-            if not m:
-                continue
-            q1, q2, r1, r2, _ = m.groups()
-            q1 = int(q1); q2 = int(q2); r1 = int(r1); r2 = int(r2)
-            qmax = max(qmax, q1, q2)
-            rmax = max(rmax, r1, r2)
-            n += 1
-            if n >= max_al:
-                break
+    for q1, q2, r1, r2, _ in alns[:max_al]:
+        qmax = max(qmax, q1, q2)
+        rmax = max(rmax, r1, r2)
+        n += 1
     return qmax, rmax, n
 
 def svg_header(w: int, h: int) -> str:
@@ -68,7 +71,8 @@ def main():
         sys.stderr.write(f"[ERROR] YOP not found: {args.yop}\n")
         sys.exit(2)
 
-    qmax, rmax, n_aln = read_bounds(args.yop, args.max_al)
+    alns = read_alignments(args.yop)
+    qmax, rmax, n_aln = read_bounds(alns, args.max_al)
 
     # Empty alignment: still emit a frame
     x_max = qmax if qmax > 0 else 1
@@ -100,23 +104,18 @@ def main():
     rev = args.reverse_color
     thk = args.thickness
 
-    with open(args.yop, "r", encoding="utf-8", errors="ignore") as fh:
-        w = buf.write
-        for line in fh:
-            m = RE_ALN.match(line)
-            if not m:
-                continue
-            q1, q2, r1, r2, fr = m.groups()
-            q1 = int(q1); q2 = int(q2); r1 = int(r1); r2 = int(r2)
+    lines = []
+    add = lines.append
+    for q1, q2, r1, r2, forward in alns:
+        x1 = left + int(round(q1 / fact))
+        x2 = left + int(round(q2 / fact))
 
-            x1 = left + int(round(q1 / fact))
-            x2 = left + int(round(q2 / fact))
+        y1 = top + int(round(dimY - (r1 / fact)))
+        y2 = top + int(round(dimY - (r2 / fact)))
 
-            y1 = top + int(round(dimY - (r1 / fact)))
-            y2 = top + int(round(dimY - (r2 / fact)))
-
-            color = fwd if fr == 'f' else rev
-            w(f"<line x1=\"{x1}\" y1=\"{y1}\" x2=\"{x2}\" y2=\"{y2}\" stroke=\"{color}\" stroke-width=\"{thk}\"/>\n")
+        color = fwd if forward else rev
+        add(f"<line x1=\"{x1}\" y1=\"{y1}\" x2=\"{x2}\" y2=\"{y2}\" stroke=\"{color}\" stroke-width=\"{thk}\"/>\n")
+    buf.write("".join(lines))
 
     buf.write(svg_footer())
 